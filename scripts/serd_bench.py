@@ -1,14 +1,25 @@
 #!/usr/bin/env python
 
 import argparse
+import concurrent.futures
 import csv
 import itertools
 import math
 import matplotlib
+import numpy
 import os
+import re
 import subprocess
 import sys
 
+# User time and max RSS lines from a /usr/bin/time -v report
+TIME_REPORT_REGEX = re.compile(
+    rb"^\tUser time[^:]*:\s*([0-9.]+)$"
+    rb".*?"
+    rb"^\tMaximum resident set[^:]*:\s*([0-9.]+)$",
+    re.DOTALL | re.MULTILINE,
+)
+
 
 class WorkingDirectory:
     "Scoped context for changing working directory"
@@ -35,30 +46,30 @@ def filename(n):
 def gen(sp2b_dir, n_min, n_max, step):
     "Generate files with n_min ... n_max statements if they are not present"
     with WorkingDirectory(sp2b_dir) as dir:
+        out_dir = os.path.join(dir.original_dir, "build")
+        try:
+            existing = set(os.listdir(out_dir))
+        except FileNotFoundError:
+            existing = set()
+
         for n in range(n_min, n_max + step, step):
-            out_path = os.path.join(dir.original_dir, "build", filename(n))
-            if not os.path.exists(out_path):
+            if filename(n) not in existing:
+                out_path = os.path.join(out_dir, filename(n))
                 subprocess.call(["./sp2b_gen", "-t", str(n), out_path])
 
 
-def write_header(results, progs):
+def write_header(writer, progs):
     "Write the header line for TSV output"
-    results.write("n")
-    for prog in progs:
-        results.write("\t" + os.path.basename(prog.split()[0]))
-    results.write("\n")
+    writer.writerow(["n"] + [os.path.basename(p.split()[0]) for p in progs])
 
 
 def parse_time(report):
     "Return user time and max RSS from a /usr/bin/time -v report"
-    time = memory = None
-    for line in report.split("\n"):
-        if line.startswith("\tUser time"):
-            time = float(line[line.find(":") + 1 :])
-        elif line.startswith("\tMaximum resident set"):
-            memory = float(line[line.find(":") + 1 :]) * 1024
+    match = TIME_REPORT_REGEX.search(report)
+    if match is None:
+        return (None, None)
 
-    return (time, memory)
+    return (float(match.group(1)), float(match.group(2)) * 1024)
 
 
 def get_dashes():
@@ -75,23 +86,17 @@ def get_dashes():
         yield [dash, space] + [dot, space] * (i - 1)
 
 
-def plot(in_file, out_filename, x_label, y_label, y_max=None):
+def plot(fig, in_file, out_filename, x_label, y_label, y_max=None):
     "Plot a TSV file as SVG"
 
-    matplotlib.use("agg")
-    import matplotlib.pyplot as plt
-
-    fig_height = 4.0
     dashes = get_dashes()
     markers = itertools.cycle(["o", "s", "v", "D", "*", "p", "P", "h", "X"])
 
-    reader = csv.reader(in_file, delimiter="\t")
-    header = next(reader)
-    cols = [x for x in zip(*list(reader))]
+    header = in_file.readline().rstrip("\n").split("\t")
+    data = numpy.loadtxt(in_file, delimiter="\t", ndmin=2)
 
-    plt.clf()
-    fig = plt.figure(figsize=(fig_height * math.sqrt(2), fig_height))
-    ax = fig.add_subplot(111)
+    ax = fig.axes[0]
+    ax.clear()
 
     ax.set_xlabel(x_label)
     ax.set_ylabel(y_label)
@@ -103,87 +108,108 @@ def plot(in_file, out_filename, x_label, y_label, y_max=None):
     ax.ticklabel_format(style="sci", scilimits=(4, 0), useMathText=True)
     ax.tick_params(axis="both", width=0.75)
 
-    x = list(map(float, cols[0]))
-    for i, y in enumerate(cols[1::]):
+    x = data[:, 0]
+    for i in range(1, data.shape[1]):
         ax.plot(
             x,
-            list(map(float, y)),
-            label=header[i + 1],
+            data[:, i],
+            label=header[i],
             marker=next(markers),
             dashes=next(dashes),
             markersize=3.0,
             linewidth=1.0,
         )
 
-    plt.legend()
-    plt.savefig(out_filename, bbox_inches="tight", pad_inches=0.025)
-    plt.close()
+    ax.legend()
+    fig.savefig(out_filename, bbox_inches="tight", pad_inches=0.025)
     sys.stderr.write("wrote {}\n".format(out_filename))
 
 
-def run(progs, n_min, n_max, step):
+def measure(job):
+    "Run a benchmark job (n, index, command) and return user time and max RSS"
+    n, index, command = job
+    in_path = filename(n)
+    cmd = command + [in_path]
+    with open("%s.%d.out" % (in_path, index), "w") as out:
+        sys.stderr.write(" ".join(cmd) + "\n")
+        proc = subprocess.run(cmd, stdout=out, stderr=subprocess.PIPE)
+
+        return parse_time(proc.stderr)
+
+
+def run(progs, n_min, n_max, step, jobs=1):
     "Benchmark each program with n_min ... n_max statements"
     with WorkingDirectory("build"):
-        results = {
-            "time": open("serdi-time.txt", "w"),
-            "throughput": open("serdi-throughput.txt", "w"),
-            "memory": open("serdi-memory.txt", "w"),
+        files = {
+            "time": open("serdi-time.txt", "w", buffering=65536),
+            "throughput": open("serdi-throughput.txt", "w", buffering=65536),
+            "memory": open("serdi-memory.txt", "w", buffering=65536),
         }
 
-        # Write TSV header for all output files
-        for name, f in results.items():
-            write_header(f, progs)
-
-        for n in range(n_min, n_max + step, step):
-            # Add first column (n) to rows
-            rows = {}
-            for name, _ in results.items():
-                rows[name] = [str(n)]
-
-            # Run each program and fill rows with measurements
-            for prog in progs:
-                cmd = "/usr/bin/time -v " + prog + " " + filename(n)
-                with open(filename(n) + ".out", "w") as out:
-                    sys.stderr.write(cmd + "\n")
-                    proc = subprocess.Popen(
-                        cmd.split(), stdout=out, stderr=subprocess.PIPE
-                    )
-
-                    time, memory = parse_time(proc.communicate()[1].decode())
-                    rows["time"] += ["%.07f" % time]
-                    rows["throughput"] += ["%d" % (n / time)]
-                    rows["memory"] += [str(memory)]
-
-            # Write rows to output files
-            for name, f in results.items():
-                f.write("\t".join(rows[name]) + "\n")
-
-        for name, f in results.items():
+        # Make a TSV writer and write the header for each output file
+        results = {}
+        for name, f in files.items():
+            results[name] = csv.writer(f, delimiter="\t", lineterminator="\n")
+            write_header(results[name], progs)
+
+        # Run every program on every input, up to jobs at a time
+        sizes = range(n_min, n_max + step, step)
+        commands = [["/usr/bin/time", "-v"] + prog.split() for prog in progs]
+        with concurrent.futures.ThreadPoolExecutor(jobs) as executor:
+            measurements = executor.map(
+                measure,
+                [(n, i, c) for n in sizes for i, c in enumerate(commands)],
+            )
+
+            for n in sizes:
+                # Fill rows with n and measurements for each program in order
+                times = [str(n)]
+                throughputs = [str(n)]
+                memories = [str(n)]
+                for _ in progs:
+                    time, memory = next(measurements)
+                    times.append("%.07f" % time)
+                    throughputs.append("%d" % (n / time))
+                    memories.append(str(memory))
+
+                # Write rows to output files
+                results["time"].writerow(times)
+                results["throughput"].writerow(throughputs)
+                results["memory"].writerow(memories)
+
+        for name, f in files.items():
+            f.close()
             tsv_filename = "serdi-%s.txt" % name
             sys.stderr.write("wrote %s\n" % tsv_filename)
 
 
 def plot_results():
     "Plot all benchmark results"
+
+    matplotlib.use("agg")
+    import matplotlib.pyplot as plt
+
+    fig_height = 4.0
+    fig = plt.figure(figsize=(fig_height * math.sqrt(2), fig_height))
+    fig.add_subplot(111)
+
     with WorkingDirectory("build"):
-        plot(
-            open("serdi-time.txt", "r"),
-            "serdi-time.svg",
-            "Statements",
-            "Time (s)",
-        )
-        plot(
-            open("serdi-throughput.txt", "r"),
-            "serdi-throughput.svg",
-            "Statements",
-            "Statements / s",
-        )
-        plot(
-            open("serdi-memory.txt", "r"),
-            "serdi-memory.svg",
-            "Statements",
-            "Bytes",
-        )
+        with open("serdi-time.txt", "r") as in_file:
+            plot(fig, in_file, "serdi-time.svg", "Statements", "Time (s)")
+
+        with open("serdi-throughput.txt", "r") as in_file:
+            plot(
+                fig,
+                in_file,
+                "serdi-throughput.svg",
+                "Statements",
+                "Statements / s",
+            )
+
+        with open("serdi-memory.txt", "r") as in_file:
+            plot(fig, in_file, "serdi-memory.svg", "Statements", "Bytes")
+
+    plt.close(fig)
 
 
 if __name__ == "__main__":
@@ -203,6 +229,12 @@ example:
     ap.add_argument(
         "--max", type=int, default=1000000, help="maximum triple count"
     )
+    ap.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of benchmarks to run in parallel (default: 1)",
+    )
     ap.add_argument(
         "--run",
         type=str,
@@ -231,6 +263,6 @@ example:
     if not args.no_generate:
         gen(args.sp2b_dir, min_n, max_n, step)
     if not args.no_execute:
-        run(progs, min_n, max_n, step)
+        run(progs, min_n, max_n, step, args.jobs)
     if not args.no_plot:
         plot_results()